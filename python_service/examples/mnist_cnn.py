@@ -1,3 +1,4 @@
+import contextlib
 import os
 import sys
 from pathlib import Path
@@ -9,11 +10,17 @@ sys.path.append(str(SCRIPT_DIR))
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader
 from torchvision import datasets, transforms
 
+from examples.prefetcher import Prefetcher
 from neuroscope import visualize
 
+# MNIST normalization, applied batch-wise on the device instead of per sample
+MNIST_MEAN = 0.1307
+MNIST_STD = 0.3081
+
 
 class SimpleCNN(nn.Module):
     """A simple CNN for MNIST classification.
@@ -55,10 +62,21 @@ class SimpleCNN(nn.Module):
         return F.log_softmax(x, dim=1)
 
 @visualize(save_path='neuroscope_training.json')
-def train_model(model, train_loader, test_loader, epochs=5):
+def train_model(model, train_loader, test_loader, epochs=5, accum_steps=1):
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     model = model.to(device)
     optimizer = torch.optim.Adam(model.parameters())
+
+    # The visualize hooks are already registered on the eager model; compile a
+    # separate handle so the returned model keeps its plain state_dict keys
+    compiled_model = torch.compile(model, mode='reduce-overhead') if hasattr(torch, 'compile') else model
+
+    # Mixed precision only applies on CUDA; on CPU autocast and the scaler are no-ops
+    use_amp = device.type == 'cuda'
+    if hasattr(torch.amp, 'GradScaler'):
+        scaler = torch.amp.GradScaler(device.type, enabled=use_amp)
+    else:  # torch < 2.3
+        scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
     
     print("\nStarting training with visualization...")
     print("Training data will be saved to 'neuroscope_training.json'")
@@ -69,19 +87,40 @@ def train_model(model, train_loader, test_loader, epochs=5):
         correct = 0
         total = 0
 
-        for batch_idx, (data, target) in enumerate(train_loader):
-            data, target = data.to(device), target.to(device)
+        num_batches = len(train_loader)
+        step = 0
+        prefetcher = Prefetcher(train_loader, device)
+        while (batch := prefetcher.next()) is not None:
+            data, target = batch
+            data = data.sub_(MNIST_MEAN).div_(MNIST_STD)
             
-            optimizer.zero_grad()
-            output = model(data)
-            loss = F.nll_loss(output, target)
-            loss.backward()
-            optimizer.step()
+            # Gradients are accumulated over accum_steps batches; under DDP they
+            # are only all-reduced on the batch that ends each window
+            is_step = (step + 1) % accum_steps == 0 or step + 1 == num_batches
+            if isinstance(model, DistributedDataParallel) and not is_step:
+                sync_context = model.no_sync()
+            else:
+                sync_context = contextlib.nullcontext()
+            
+            if step % accum_steps == 0:
+                optimizer.zero_grad(set_to_none=True)
+                # The last window of an epoch may be shorter than accum_steps
+                window_size = min(accum_steps, num_batches - step)
+            with sync_context:
+                with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=use_amp):
+                    output = compiled_model(data)
+                    loss = F.nll_loss(output, target)
+                scaler.scale(loss / window_size).backward()
+            
+            if is_step:
+                scaler.step(optimizer)
+                scaler.update()
 
             total_loss += loss.item()
             pred = output.argmax(dim=1, keepdim=True)
             correct += pred.eq(target.view_as(pred)).sum().item()
             total += target.size(0)
+            step += 1
 
         # Validation
         model.eval()
@@ -89,9 +128,11 @@ def train_model(model, train_loader, test_loader, epochs=5):
         correct = 0
         with torch.no_grad():
             for data, target in test_loader:
-                data, target = data.to(device), target.to(device)
-                output = model(data)
-                test_loss += F.nll_loss(output, target, reduction='sum').item()
+                data, target = data.to(device, non_blocking=True), target.to(device, non_blocking=True)
+                data = data.sub_(MNIST_MEAN).div_(MNIST_STD)
+                with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=use_amp):
+                    output = compiled_model(data)
+                    test_loss += F.nll_loss(output, target, reduction='sum').item()
                 pred = output.argmax(dim=1, keepdim=True)
                 correct += pred.eq(target.view_as(pred)).sum().item()
 
@@ -182,16 +223,20 @@ def main():
     
     print("Loading MNIST dataset...")
     # Load MNIST dataset
-    transform = transforms.Compose([
-        transforms.ToTensor(),
-        transforms.Normalize((0.1307,), (0.3081,))
-    ])
+    # Normalization happens on the device in train_model
+    transform = transforms.ToTensor()
 
     train_dataset = datasets.MNIST('data', train=True, download=True, transform=transform)
     test_dataset = datasets.MNIST('data', train=False, transform=transform)
 
-    train_loader = DataLoader(train_dataset, batch_size=64, shuffle=True)
-    test_loader = DataLoader(test_dataset, batch_size=1000)
+    # Pinned host memory lets the training loop copy batches to the GPU asynchronously
+    loader_kwargs = {
+        'pin_memory': torch.cuda.is_available(),
+        'num_workers': 4,
+        'persistent_workers': True,
+    }
+    train_loader = DataLoader(train_dataset, batch_size=64, shuffle=True, **loader_kwargs)
+    test_loader = DataLoader(test_dataset, batch_size=1000, **loader_kwargs)
 
     # Create and save initial model
     print("\nInitializing model...")
@@ -0,0 +1,76 @@
+import torch
+
+
+def _to_device(batch, device, host_keys=()):
+    """Move every tensor in a (possibly nested) batch to `device`.
+
+    Dict entries named in `host_keys` are left where they are.
+    """
+    if isinstance(batch, torch.Tensor):
+        return batch.to(device, non_blocking=True)
+    if isinstance(batch, dict):
+        return {
+            key: value if key in host_keys else _to_device(value, device, host_keys)
+            for key, value in batch.items()
+        }
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(_to_device(value, device, host_keys) for value in batch)
+    return batch
+
+
+def _record_stream(batch, stream):
+    """Mark tensors copied on a side stream as used by `stream`."""
+    if isinstance(batch, torch.Tensor):
+        if batch.is_cuda:
+            batch.record_stream(stream)
+    elif isinstance(batch, dict):
+        for value in batch.values():
+            _record_stream(value, stream)
+    elif isinstance(batch, (list, tuple)):
+        for value in batch:
+            _record_stream(value, stream)
+
+
+class Prefetcher:
+    """Copies batch N+1 to the device on a side CUDA stream while step N runs.
+
+    On CPU-only runs batches are simply moved to the device in order. Dict
+    entries named in `host_keys` (e.g. sequence lengths that are only needed
+    on the CPU) are not copied.
+    Usage:
+        prefetcher = Prefetcher(train_loader, device)
+        while (batch := prefetcher.next()) is not None:
+            ...
+    """
+    def __init__(self, loader, device, host_keys=()):
+        self.loader = iter(loader)
+        self.device = device
+        self.host_keys = host_keys
+        self.stream = torch.cuda.Stream() if device.type == 'cuda' else None
+        self.preload()
+
+    def preload(self):
+        try:
+            batch = next(self.loader)
+        except StopIteration:
+            self.batch = None
+            return
+
+        if self.stream is None:
+            self.batch = _to_device(batch, self.device, self.host_keys)
+            return
+
+        with torch.cuda.stream(self.stream):
+            self.batch = _to_device(batch, self.device, self.host_keys)
+
+    def next(self):
+        if self.stream is not None:
+            current = torch.cuda.current_stream()
+            current.wait_stream(self.stream)
+            if self.batch is not None:
+                _record_stream(self.batch, current)
+
+        batch = self.batch
+        if batch is not None:
+            self.preload()
+        return batch
@@ -1,3 +1,4 @@
+import contextlib
 import os
 import sys
 from pathlib import Path
@@ -6,13 +7,13 @@ from pathlib import Path
 SCRIPT_DIR = Path(__file__).resolve().parent.parent
 sys.path.append(str(SCRIPT_DIR))
 
-import numpy as np
 import torch
 import torch.nn as nn
-import torch.nn.functional as F
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader, Dataset
-from transformers import BertTokenizer
+from transformers import BertTokenizerFast
 
+from examples.prefetcher import Prefetcher
 from neuroscope import visualize
 
 from ..training_hook import NeuroscopeTrainingHook
@@ -24,12 +25,16 @@ class SentimentAttention(nn.Module):
         self.attention = nn.Linear(hidden_size, 1)
         self.output = None  # Store attention weights
     
-    def forward(self, x):
+    def forward(self, x, mask=None):
         # x shape: (batch, seq_len, hidden_size)
-        attention_weights = F.softmax(self.attention(x), dim=1)
+        scores = self.attention(x).squeeze(-1)  # (batch, seq_len)
+        if mask is not None:
+            # Padding positions get no attention
+            scores = scores.masked_fill(~mask, float('-inf'))
+        attention_weights = scores.softmax(dim=-1)
         self.output = attention_weights  # Save for visualization
-        attended = torch.bmm(attention_weights.transpose(1, 2), x)
-        return attended.squeeze(1), attention_weights.squeeze(-1)
+        attended = torch.einsum('bl,blh->bh', attention_weights, x)
+        return attended, attention_weights
 
 class SentimentAnalysisModel(nn.Module):
     def __init__(self, vocab_size=30522, embed_size=128, hidden_size=256, num_classes=2):
@@ -39,20 +44,22 @@ class SentimentAnalysisModel(nn.Module):
         self.attention = SentimentAttention(hidden_size * 2)
         self.classifier = nn.Linear(hidden_size * 2, num_classes)
         
-    def forward(self, x, lengths):
+    def forward(self, x, attention_mask, lengths):
         embedded = self.embedding(x)
         
-        # Pack for LSTM
+        # Pack for the LSTM so the backward direction starts at each
+        # sequence's last real token instead of running through the padding.
+        # `lengths` stays on the CPU, so packing needs no device sync.
         packed = nn.utils.rnn.pack_padded_sequence(
-            embedded, lengths.cpu(), batch_first=True, enforce_sorted=False
+            embedded, lengths, batch_first=True, enforce_sorted=False
         )
-        
-        # LSTM
         lstm_out, _ = self.lstm(packed)
-        lstm_out, _ = nn.utils.rnn.pad_packed_sequence(lstm_out, batch_first=True)
+        lstm_out, _ = nn.utils.rnn.pad_packed_sequence(
+            lstm_out, batch_first=True, total_length=x.size(1)
+        )
         
         # Attention
-        attended, attention_weights = self.attention(lstm_out)
+        attended, attention_weights = self.attention(lstm_out, attention_mask.bool())
         
         # Classification
         logits = self.classifier(attended)
@@ -66,34 +73,48 @@ class TweetDataset(Dataset):
         self.tokenizer = tokenizer
         self.max_len = max_len
         
-    def __len__(self):
-        return len(self.texts)
-    
-    def __getitem__(self, idx):
-        text = self.texts[idx]
-        label = self.labels[idx]
-        
-        encoding = self.tokenizer(
-            text,
-            max_length=self.max_len,
+        # Tokenize the whole corpus once instead of on every access
+        encodings = tokenizer(
+            list(texts),
+            max_length=max_len,
             padding='max_length',
             truncation=True,
             return_tensors='pt'
         )
+        self.input_ids = encodings['input_ids']
+        self.attention_mask = encodings['attention_mask']
+        self.lengths = self.attention_mask.sum(dim=1)
+        self.labels_tensor = torch.tensor(labels, dtype=torch.long)
         
+    def __len__(self):
+        return len(self.texts)
+    
+    def __getitem__(self, idx):
         return {
-            'input_ids': encoding['input_ids'].squeeze(),
-            'attention_mask': encoding['attention_mask'].squeeze(),
-            'label': torch.tensor(label, dtype=torch.long)
+            'input_ids': self.input_ids[idx],
+            'attention_mask': self.attention_mask[idx],
+            'length': self.lengths[idx],
+            'label': self.labels_tensor[idx]
         }
 
-def train_model(model, train_loader, val_loader, num_epochs=5):
+def train_model(model, train_loader, val_loader, num_epochs=5, accum_steps=1):
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     model = model.to(device)
     
+    # Compile a separate handle; the eager model is still what gets handed to
+    # the visualization hook
+    compiled_model = torch.compile(model, mode='reduce-overhead') if hasattr(torch, 'compile') else model
+    
     criterion = nn.CrossEntropyLoss()
     optimizer = torch.optim.Adam(model.parameters())
     
+    # Mixed precision only applies on CUDA; on CPU autocast and the scaler are no-ops
+    use_amp = device.type == 'cuda'
+    if hasattr(torch.amp, 'GradScaler'):
+        scaler = torch.amp.GradScaler(device.type, enabled=use_amp)
+    else:  # torch < 2.3
+        scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
+    
     # Initialize Neuroscope visualization hook
     vis_hook = NeuroscopeTrainingHook(update_interval=10)
     
@@ -102,19 +123,40 @@ def train_model(model, train_loader, val_loader, num_epochs=5):
         total_loss = 0
         correct = 0
         total = 0
+        running_entropy = torch.zeros((), device=device)
+        entropy_steps = 0
         
-        for batch in train_loader:
-            input_ids = batch['input_ids'].to(device)
-            attention_mask = batch['attention_mask'].to(device)
-            labels = batch['label'].to(device)
-            lengths = attention_mask.sum(dim=1)
+        num_batches = len(train_loader)
+        prefetcher = Prefetcher(train_loader, device, host_keys=('length',))
+        step = 0
+        while (batch := prefetcher.next()) is not None:
+            input_ids = batch['input_ids']
+            attention_mask = batch['attention_mask']
+            lengths = batch['length']
+            labels = batch['label']
+            
+            # Gradients are accumulated over accum_steps batches; under DDP they
+            # are only all-reduced on the batch that ends each window
+            is_step = (step + 1) % accum_steps == 0 or step + 1 == num_batches
+            if isinstance(model, DistributedDataParallel) and not is_step:
+                sync_context = model.no_sync()
+            else:
+                sync_context = contextlib.nullcontext()
             
-            optimizer.zero_grad()
-            logits, attention_weights = model(input_ids, lengths)
-            loss = criterion(logits, labels)
+            if step % accum_steps == 0:
+                optimizer.zero_grad(set_to_none=True)
+                # The last window of an epoch may be shorter than accum_steps
+                window_size = min(accum_steps, num_batches - step)
+            with sync_context:
+                with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=use_amp):
+                    logits, attention_weights = compiled_model(input_ids, attention_mask, lengths)
+                    loss = criterion(logits, labels)
+                
+                scaler.scale(loss / window_size).backward()
             
-            loss.backward()
-            optimizer.step()
+            if is_step:
+                scaler.step(optimizer)
+                scaler.update()
             
             total_loss += loss.item()
             
@@ -123,21 +165,27 @@ def train_model(model, train_loader, val_loader, num_epochs=5):
             total += labels.size(0)
             correct += (predicted == labels).sum().item()
             
-            # Get attention patterns for visualization
-            attention_pattern = attention_weights.detach().cpu().numpy().mean(0)
+            # Accumulate attention entropy on-device; it is only read back
+            # when the visualization hook fires
+            attention = attention_weights.detach()
+            running_entropy += -(attention * (attention + 1e-10).log()).sum(dim=-1).mean()
+            entropy_steps += 1
             
             # Update visualization
-            vis_hook(
-                model,
-                loss.item(),
-                epoch,
-                accuracy=correct/total,
-                custom_metrics={
-                    'attention_entropy': float(-np.sum(
-                        attention_pattern * np.log(attention_pattern + 1e-10)
-                    ))
-                }
-            )
+            if step % vis_hook.update_interval == 0:
+                vis_hook(
+                    model,
+                    loss.item(),
+                    epoch,
+                    accuracy=correct/total,
+                    custom_metrics={
+                        'attention_entropy': (running_entropy / entropy_steps).item()
+                    }
+                )
+                running_entropy.zero_()
+                entropy_steps = 0
+            
+            step += 1
         
         # Validation
         model.eval()
@@ -147,13 +195,14 @@ def train_model(model, train_loader, val_loader, num_epochs=5):
         
         with torch.no_grad():
             for batch in val_loader:
-                input_ids = batch['input_ids'].to(device)
-                attention_mask = batch['attention_mask'].to(device)
-                labels = batch['label'].to(device)
-                lengths = attention_mask.sum(dim=1)
+                input_ids = batch['input_ids'].to(device, non_blocking=True)
+                attention_mask = batch['attention_mask'].to(device, non_blocking=True)
+                lengths = batch['length']
+                labels = batch['label'].to(device, non_blocking=True)
                 
-                logits, _ = model(input_ids, lengths)
-                loss = criterion(logits, labels)
+                with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=use_amp):
+                    logits, _ = compiled_model(input_ids, attention_mask, lengths)
+                    loss = criterion(logits, labels)
                 
                 val_loss += loss.item()
                 
@@ -169,7 +218,7 @@ def train_model(model, train_loader, val_loader, num_epochs=5):
 
 def main():
     # Initialize tokenizer
-    tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
+    tokenizer = BertTokenizerFast.from_pretrained('bert-base-uncased')
     
     # Example data (replace with real dataset)
     texts = [
@@ -185,8 +234,14 @@ def main():
     val_size = len(dataset) - train_size
     train_dataset, val_dataset = torch.utils.data.random_split(dataset, [train_size, val_size])
     
-    train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=32)
+    # Pinned host memory lets the training loop copy batches to the GPU asynchronously
+    loader_kwargs = {
+        'pin_memory': torch.cuda.is_available(),
+        'num_workers': 4,
+        'persistent_workers': True,
+    }
+    train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, **loader_kwargs)
+    val_loader = DataLoader(val_dataset, batch_size=32, **loader_kwargs)
     
     # Initialize model
     model = SentimentAnalysisModel()
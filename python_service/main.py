@@ -1,10 +1,9 @@
+import io
 import json
-import os
-import tempfile
 from typing import Dict, List
 
 import torch
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import FastAPI, File, HTTPException, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from models import NetworkConnection, NetworkNode, NeuroscopeNetwork
 from pytorch_converter import convert_pytorch_model
@@ -51,26 +50,13 @@ async def import_pytorch_model(
             detail="Invalid info file type. Only .pt files are supported."
         )
 
-    weights_tmp = None
-    info_tmp = None
-    
     try:
-        # Create temporary files
-        weights_tmp = tempfile.NamedTemporaryFile(delete=False)
-        info_tmp = tempfile.NamedTemporaryFile(delete=False)
-        
-        # Write files to disk
-        weights_tmp.write(await weights_file.read())
-        info_tmp.write(await info_file.read())
-        weights_tmp.flush()
-        info_tmp.flush()
-        
-        # Close files before loading them with torch
-        weights_tmp.close()
-        info_tmp.close()
-        
-        # Load the model info
-        model_info = torch.load(info_tmp.name, map_location=torch.device('cpu'))
+        # Load the model info straight from the uploaded bytes
+        model_info = torch.load(
+            io.BytesIO(await info_file.read()),
+            map_location=torch.device('cpu'),
+            weights_only=True
+        )
         if not isinstance(model_info, dict) or 'layers' not in model_info:
             raise HTTPException(
                 status_code=400,
@@ -78,13 +64,25 @@ async def import_pytorch_model(
             )
         
         # Load the weights
-        weights = torch.load(weights_tmp.name, map_location=torch.device('cpu'))
+        weights = torch.load(
+            io.BytesIO(await weights_file.read()),
+            map_location=torch.device('cpu'),
+            weights_only=True
+        )
         if not isinstance(weights, dict):
             raise HTTPException(
                 status_code=400,
                 detail="Invalid weights file format"
             )
         
+        # Mean absolute weight of every connected layer, gathered in one batch
+        weight_keys = [f"{layer['name']}.weight" for layer in model_info['layers']]
+        present_keys = [key for key in weight_keys[1:] if key in weights]
+        weight_means = {}
+        if present_keys:
+            means = torch.stack([weights[key].abs().mean().float() for key in present_keys])
+            weight_means = dict(zip(present_keys, means.tolist()))
+        
         # Convert layers to nodes
         nodes = []
         connections = []
@@ -100,12 +98,8 @@ async def import_pytorch_model(
             
             # Add connection from previous layer if it exists
             if prev_node is not None:
-                # Get weight matrix if available
-                weight_key = f"{layer['name']}.weight"
-                weight = 1.0  # Default weight
-                if weight_key in weights:
-                    weight_tensor = weights[weight_key]
-                    weight = float(torch.mean(torch.abs(weight_tensor)).item())
+                # Use the layer's mean weight if available
+                weight = weight_means.get(weight_keys[i], 1.0)  # Default weight
                 
                 connection = NetworkConnection(
                     source=prev_node.id,
@@ -124,25 +118,14 @@ async def import_pytorch_model(
             connections=connections
         )
         
-        return network.dict()
+        # Serialize directly to JSON with pydantic-core, skipping the dict intermediate
+        return Response(content=network.model_dump_json(), media_type="application/json")
                 
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to process model: {str(e)}"
         )
-    finally:
-        # Clean up temporary files
-        if weights_tmp:
-            try:
-                os.unlink(weights_tmp.name)
-            except:
-                pass
-        if info_tmp:
-            try:
-                os.unlink(info_tmp.name)
-            except:
-                pass
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,14 +1,90 @@
 import json
 import os
+import weakref
 from functools import wraps
 
 import numpy as np
 import torch
+import torch.nn as nn
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
 
-def visualize(save_path='neuroscope_data.json'):
+# Layer types whose activation/weight/gradient stats are recorded
+WEIGHT_TYPES = (
+    nn.Conv1d, nn.Conv2d, nn.Conv3d,
+    nn.Linear,
+    nn.LayerNorm,
+    nn.BatchNorm1d, nn.BatchNorm2d, nn.BatchNorm3d,
+    nn.Embedding,
+)
+
+# Tracked submodules per model, so repeated decorated calls don't re-walk the tree
+_tracked_cache = weakref.WeakKeyDictionary()
+
+
+def _eager(fn):
+    """Keep a hook out of torch.compile graphs.
+
+    The hooks mutate a Python step counter, which a compiled graph would
+    otherwise guard on and recompile for at every step.
+    """
+    compiler = getattr(torch, 'compiler', None)
+    if compiler is not None and hasattr(compiler, 'disable'):
+        return compiler.disable(fn)
+    return fn
+
+
+def _tracked_modules(model):
+    """Return the (name, module) pairs of `model` that visualize hooks."""
+    tracked = _tracked_cache.get(model)
+    if tracked is None:
+        tracked = [
+            (name, module) for name, module in model.named_modules()
+            if isinstance(module, WEIGHT_TYPES) and module.weight is not None
+        ]
+        _tracked_cache[model] = tracked
+    return tracked
+
+
+def _round(value):
+    """Round a stat to 4 significant digits, about the precision of float16."""
+    return float(f'{value:.4g}')
+
+
+def _columnar(tracked, steps, columns, values):
+    """Lay recorded stats out as one row per sampled step, one column per layer.
+
+    Layers that did not run on a sampled step are left as None.
+    """
+    num_layers = len(tracked)
+    rows = {}
+    for step, column, stat in zip(steps, columns, values):
+        if step not in rows:
+            rows[step] = tuple([None] * num_layers for _ in range(3))
+        for row, value in zip(rows[step], stat):
+            row[column] = _round(value)
+
+    return {
+        'names': [name for name, _ in tracked],
+        'types': [module.__class__.__name__ for _, module in tracked],
+        'steps': list(rows),
+        'activations': [row[0] for row in rows.values()],
+        'weights': [row[1] for row in rows.values()],
+        'gradients': [row[2] for row in rows.values()],
+    }
+
+
+def visualize(save_path='neuroscope_data.json', sample_every=50):
     """
     A simple decorator to capture model states during training/inference.
+
+    Per-layer stats are sampled, not recorded per step: only every
+    `sample_every`-th forward pass of the model is captured. The saved file
+    is columnar: `names`/`types` list the tracked layers, and `activations`,
+    `weights` and `gradients` hold one row per sampled step in `steps`.
     Usage:
         @visualize()
         def train(model, ...):
@@ -17,23 +93,39 @@ def visualize(save_path='neuroscope_data.json'):
     def decorator(func):
         @wraps(func)
         def wrapper(model, *args, **kwargs):
-            # Save initial model state
-            states = []
+            # Per-layer stats stay on the model's device as 0-dim tensors so the
+            # hooks never force a host sync; they are copied back once at the end
+            tracked = _tracked_modules(model)
+            column_of = {module: i for i, (_, module) in enumerate(tracked)}
+            steps = []
+            columns = []
+            stats = []
+            step = -1
+
+            @_eager
+            def count_step(module, input):
+                nonlocal step
+                step += 1
             
+            @_eager
             def hook(module, input, output):
-                if hasattr(module, 'weight'):
-                    states.append({
-                        'name': module.__class__.__name__,
-                        'activations': float(torch.mean(torch.abs(output.detach())).item()),
-                        'weights': float(torch.mean(torch.abs(module.weight.detach())).item()),
-                        'gradients': float(torch.mean(torch.abs(module.weight.grad)).item()) if module.weight.grad is not None else 0.0
-                    })
+                if step % sample_every != 0:
+                    return
+                with torch.no_grad():
+                    weight = module.weight.detach()
+                    grad = module.weight.grad
+                    steps.append(step)
+                    columns.append(column_of[module])
+                    stats.append(torch.stack([
+                        output.detach().abs().mean().float(),
+                        weight.abs().mean().float(),
+                        grad.abs().mean().float() if grad is not None else weight.new_zeros((), dtype=torch.float32)
+                    ]))
 
             # Register forward hooks
-            hooks = []
-            for name, module in model.named_modules():
-                if hasattr(module, 'weight'):
-                    hooks.append(module.register_forward_hook(hook))
+            hooks = [model.register_forward_pre_hook(count_step)]
+            for name, module in tracked:
+                hooks.append(module.register_forward_hook(hook))
 
             # Run the original function
             result = func(model, *args, **kwargs)
@@ -42,9 +134,17 @@ def visualize(save_path='neuroscope_data.json'):
             for h in hooks:
                 h.remove()
 
+            # Materialize all recorded stats with a single device-to-host copy
+            values = torch.stack(stats).cpu().tolist() if stats else []
+            states = _columnar(tracked, steps, columns, values)
+
             # Save the data
-            with open(save_path, 'w') as f:
-                json.dump(states, f)
+            if orjson is not None:
+                with open(save_path, 'wb') as f:
+                    f.write(orjson.dumps(states))
+            else:
+                with open(save_path, 'w') as f:
+                    json.dump(states, f)
             
             print(f"\nModel visualization data saved to {save_path}")
             print("You can now load this file in the Neuroscope interface")
@@ -1,15 +1,20 @@
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-import numpy as np
 import torch
 from models import NetworkConnection, NetworkNode, NeuroscopeNetwork
 
 
-def get_layer_properties(layer: torch.nn.Module) -> Dict[str, Any]:
-    """Extract properties from a PyTorch layer."""
+def get_layer_properties(layer: torch.nn.Module, trainable_parameters: Optional[int] = None) -> Dict[str, Any]:
+    """Extract properties from a PyTorch layer.
+
+    `trainable_parameters` can be passed in when the caller has already
+    counted the layer's parameters, to avoid walking its subtree again.
+    """
+    if trainable_parameters is None:
+        trainable_parameters = sum(p.numel() for p in layer.parameters() if p.requires_grad)
     properties = {
         "type": layer.__class__.__name__,
-        "trainable_parameters": sum(p.numel() for p in layer.parameters() if p.requires_grad),
+        "trainable_parameters": trainable_parameters,
         "has_bias": hasattr(layer, "bias") and layer.bias is not None,
     }
 
@@ -66,27 +71,32 @@ def get_layer_properties(layer: torch.nn.Module) -> Dict[str, Any]:
 
 def extract_layer_metrics(model: torch.nn.Module) -> Tuple[Dict[str, float], Dict[str, float]]:
     """Extract gradients and activations from model layers."""
-    gradients = {}
-    activations = {}
-    
-    def process_layer(layer: torch.nn.Module, prefix: str = ""):
-        # Extract gradients if available
-        for name, param in layer.named_parameters():
-            if param.grad is not None:
-                grad_norm = float(torch.norm(param.grad).item())
-                gradients[f"{prefix}{name}"] = grad_norm
-
-        # Extract activations if available
-        if hasattr(layer, "output") and layer.output is not None:
-            act_norm = float(torch.norm(layer.output).item())
-            activations[prefix.rstrip(".")] = act_norm
-
-        # Process child modules
-        for name, child in layer.named_children():
-            process_layer(child, f"{prefix}{name}.")
-
-    process_layer(model)
-    return gradients, activations
+    # Gradients, keyed by parameter name
+    grad_names = []
+    grads = []
+    for name, param in model.named_parameters():
+        if param.grad is not None:
+            grad_names.append(name)
+            grads.append(param.grad)
+
+    # Activations, keyed by module name
+    act_names = []
+    acts = []
+    for name, module in model.named_modules():
+        output = getattr(module, "output", None)
+        if isinstance(output, torch.Tensor):
+            act_names.append(name)
+            acts.append(output)
+
+    return _batched_norms(grad_names, grads), _batched_norms(act_names, acts)
+
+def _batched_norms(names: List[str], tensors: List[torch.Tensor]) -> Dict[str, float]:
+    """L2 norm of each tensor, computed in one fused call and copied to the host once."""
+    if not tensors:
+        return {}
+    norms = torch._foreach_norm(tensors)
+    values = torch.stack([norm.float() for norm in norms]).cpu().tolist()
+    return dict(zip(names, values))
 
 def register_activation_hooks(model: torch.nn.Module) -> None:
     """Register forward hooks to capture layer activations."""
@@ -104,15 +114,39 @@ def convert_pytorch_model(model: torch.nn.Module) -> NeuroscopeNetwork:
     
     nodes = []
     connections = []
-    node_id_counter = 0
 
-    def process_layer(layer: torch.nn.Module, parent_id: Optional[str] = None):
-        nonlocal node_id_counter
-        layer_id = f"layer_{node_id_counter}"
-        node_id_counter += 1
+    # Pre-order walk over named_children, as a module shared between parents
+    # gets a node (and edge) under each of them; ids follow visitation order
+    modules: List[Tuple[torch.nn.Module, Optional[int]]] = []
+    stack: List[Tuple[torch.nn.Module, Optional[int]]] = [(model, None)]
+    while stack:
+        layer, parent_index = stack.pop()
+        index = len(modules)
+        modules.append((layer, parent_index))
+        children = [child for _, child in layer.named_children()]
+        stack.extend((child, index) for child in reversed(children))
+
+    # Roll trainable parameters up the tree keyed by identity, so tied or
+    # shared parameters count once per subtree. Children come after their
+    # parent in pre-order, so a reverse pass finishes each subtree first.
+    param_counts: List[int] = [0] * len(modules)
+    subtree_params: List[Dict[int, int]] = [
+        {id(p): p.numel() for p in layer.parameters(recurse=False) if p.requires_grad}
+        for layer, _ in modules
+    ]
+    for index in range(len(modules) - 1, -1, -1):
+        params = subtree_params[index]
+        param_counts[index] = sum(params.values())
+        parent_index = modules[index][1]
+        if parent_index is not None:
+            subtree_params[parent_index].update(params)
+        subtree_params[index] = {}
+
+    for index, (layer, parent_index) in enumerate(modules):
+        layer_id = f"layer_{index}"
 
         # Create node for the layer
-        properties = get_layer_properties(layer)
+        properties = get_layer_properties(layer, param_counts[index])
         nodes.append(NetworkNode(
             id=layer_id,
             type=properties["type"],
@@ -120,17 +154,20 @@ def convert_pytorch_model(model: torch.nn.Module) -> NeuroscopeNetwork:
         ))
 
         # Add connection if there's a parent and weights
-        if parent_id and hasattr(layer, "weight"):
-            weight_matrix = layer.weight.detach().cpu().numpy()
+        if parent_index is not None and getattr(layer, "weight", None) is not None:
+            weight_matrix = layer.weight.detach()
+            abs_weight = weight_matrix.abs()
             
-            # Calculate weight statistics
-            avg_weight = float(np.mean(np.abs(weight_matrix)))
-            max_weight = float(np.max(np.abs(weight_matrix)))
-            min_weight = float(np.min(np.abs(weight_matrix)))
-            std_weight = float(np.std(weight_matrix))
+            # Calculate weight statistics on the weight's device, copying back only the scalars
+            avg_weight, max_weight, min_weight, std_weight = torch.stack([
+                abs_weight.mean(),
+                abs_weight.max(),
+                abs_weight.min(),
+                weight_matrix.std(unbiased=False),
+            ]).cpu().tolist()
             
             connections.append(NetworkConnection(
-                source=parent_id,
+                source=f"layer_{parent_index}",
                 target=layer_id,
                 weight=avg_weight,
                 properties={
@@ -141,13 +178,6 @@ def convert_pytorch_model(model: torch.nn.Module) -> NeuroscopeNetwork:
                 }
             ))
 
-        # Process child modules
-        for name, child in layer.named_children():
-            process_layer(child, layer_id)
-
-    # Start conversion from the root
-    process_layer(model)
-
     return NeuroscopeNetwork(
         type="ANN",
         nodes=nodes,
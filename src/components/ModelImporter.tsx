@@ -92,7 +92,7 @@ export function ModelImporter({ onImport }: ModelImporterProps) {
 
             <input
               type="file"
-              accept=".pt,.pth"
+              accept=".json,.pt,.pth"
               onChange={handleInfoSelect}
               className="hidden"
               id="info-file"
@@ -128,7 +128,7 @@ export function ModelImporter({ onImport }: ModelImporterProps) {
             Required files:
             <ul className="list-disc list-inside mt-1">
               <li>Weights file (.pt/.pth)</li>
-              <li>Model info file (.pt/.pth)</li>
+              <li>Model info file (.json, or legacy .pt/.pth)</li>
             </ul>
           </div>
         </div>
@@ -1,14 +1,24 @@
+import gc
+import hashlib
 import json
 import os
 import tempfile
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import torch
 import torch.nn as nn
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import FastAPI, File, HTTPException, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from model_uploads import (
+    cached_response,
+    lifespan,
+    load_checkpoint,
+    remember_response,
+    run_in_loader,
+    save_upload,
+)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -19,6 +29,128 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _conv_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'in_channels': layer.in_channels,
+        'out_channels': layer.out_channels,
+        'kernel_size': layer.kernel_size,
+        'stride': layer.stride,
+        'padding': layer.padding,
+        'dilation': layer.dilation,
+        'groups': layer.groups,
+        'bias': layer.bias is not None
+    }
+
+def _batchnorm_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'num_features': layer.num_features,
+        'eps': layer.eps,
+        'momentum': layer.momentum,
+        'affine': layer.affine,
+        'track_running_stats': layer.track_running_stats
+    }
+
+def _layernorm_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'normalized_shape': layer.normalized_shape,
+        'eps': layer.eps,
+        'elementwise_affine': layer.elementwise_affine
+    }
+
+def _pool_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'kernel_size': layer.kernel_size,
+        'stride': layer.stride,
+        'padding': layer.padding
+    }
+
+def _adaptive_pool_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'output_size': layer.output_size
+    }
+
+def _rnn_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'input_size': layer.input_size,
+        'hidden_size': layer.hidden_size,
+        'num_layers': layer.num_layers,
+        'bias': layer.bias,
+        'batch_first': layer.batch_first,
+        'dropout': layer.dropout,
+        'bidirectional': layer.bidirectional
+    }
+
+def _linear_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'in_features': layer.in_features,
+        'out_features': layer.out_features,
+        'bias': layer.bias is not None
+    }
+
+def _dropout_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'p': layer.p,
+        'inplace': layer.inplace if hasattr(layer, 'inplace') else False
+    }
+
+def _activation_info(layer: nn.Module) -> Dict[str, Any]:
+    info: Dict[str, Any] = {
+        'inplace': layer.inplace if hasattr(layer, 'inplace') else False
+    }
+    if isinstance(layer, nn.LeakyReLU):
+        info['negative_slope'] = layer.negative_slope
+    return info
+
+def _embedding_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'num_embeddings': layer.num_embeddings,
+        'embedding_dim': layer.embedding_dim,
+        'padding_idx': layer.padding_idx,
+        'max_norm': layer.max_norm,
+        'norm_type': layer.norm_type,
+        'scale_grad_by_freq': layer.scale_grad_by_freq,
+        'sparse': layer.sparse
+    }
+
+def _transformer_info(layer: nn.Module) -> Dict[str, Any]:
+    return {
+        'd_model': layer.d_model,
+        'nhead': layer.nhead,
+        'dim_feedforward': layer.dim_feedforward,
+        'dropout': layer.dropout,
+        'activation': layer.activation.__class__.__name__ if layer.activation else None,
+        'layer_norm_eps': layer.layer_norm_eps,
+        'batch_first': layer.batch_first,
+        'norm_first': layer.norm_first
+    }
+
+def _no_info(layer: nn.Module) -> Dict[str, Any]:
+    return {}
+
+# Layer class -> info extractor, so each layer is dispatched with one dict lookup
+_LAYER_EXTRACTORS: Dict[type, Callable[[nn.Module], Dict[str, Any]]] = {
+    **dict.fromkeys((nn.Conv1d, nn.Conv2d, nn.Conv3d), _conv_info),
+    **dict.fromkeys((nn.BatchNorm1d, nn.BatchNorm2d, nn.BatchNorm3d), _batchnorm_info),
+    nn.LayerNorm: _layernorm_info,
+    **dict.fromkeys((nn.MaxPool1d, nn.MaxPool2d, nn.MaxPool3d,
+                     nn.AvgPool1d, nn.AvgPool2d, nn.AvgPool3d), _pool_info),
+    **dict.fromkeys((nn.AdaptiveAvgPool1d, nn.AdaptiveAvgPool2d, nn.AdaptiveAvgPool3d), _adaptive_pool_info),
+    **dict.fromkeys((nn.RNN, nn.LSTM, nn.GRU), _rnn_info),
+    nn.Linear: _linear_info,
+    **dict.fromkeys((nn.Dropout, nn.Dropout2d, nn.Dropout3d), _dropout_info),
+    **dict.fromkeys((nn.ReLU, nn.LeakyReLU, nn.PReLU, nn.RReLU,
+                     nn.SELU, nn.CELU, nn.GELU), _activation_info),
+    nn.Embedding: _embedding_info,
+    **dict.fromkeys((nn.TransformerEncoderLayer, nn.TransformerDecoderLayer), _transformer_info),
+}
+
+def _find_extractor(layer_type: type) -> Callable[[nn.Module], Dict[str, Any]]:
+    """Resolve the extractor for a layer type, falling back to isinstance for subclasses."""
+    for base, handler in _LAYER_EXTRACTORS.items():
+        if issubclass(layer_type, base):
+            return handler
+    return _no_info
+
 def extract_layer_info(layer: nn.Module) -> Dict[str, Any]:
     """Extract relevant information from a PyTorch layer."""
     info: Dict[str, Any] = {}
@@ -28,207 +160,128 @@ def extract_layer_info(layer: nn.Module) -> Dict[str, Any]:
         info['training'] = layer.training
     
     # Layer-specific attributes
-    if isinstance(layer, (nn.Conv1d, nn.Conv2d, nn.Conv3d)):
-        info.update({
-            'in_channels': layer.in_channels,
-            'out_channels': layer.out_channels,
-            'kernel_size': layer.kernel_size,
-            'stride': layer.stride,
-            'padding': layer.padding,
-            'dilation': layer.dilation,
-            'groups': layer.groups,
-            'bias': layer.bias is not None
-        })
-    
-    elif isinstance(layer, (nn.BatchNorm1d, nn.BatchNorm2d, nn.BatchNorm3d)):
-        info.update({
-            'num_features': layer.num_features,
-            'eps': layer.eps,
-            'momentum': layer.momentum,
-            'affine': layer.affine,
-            'track_running_stats': layer.track_running_stats
-        })
-    
-    elif isinstance(layer, nn.LayerNorm):
-        info.update({
-            'normalized_shape': layer.normalized_shape,
-            'eps': layer.eps,
-            'elementwise_affine': layer.elementwise_affine
-        })
-    
-    elif isinstance(layer, (nn.MaxPool1d, nn.MaxPool2d, nn.MaxPool3d,
-                          nn.AvgPool1d, nn.AvgPool2d, nn.AvgPool3d)):
-        info.update({
-            'kernel_size': layer.kernel_size,
-            'stride': layer.stride,
-            'padding': layer.padding
-        })
-    
-    elif isinstance(layer, (nn.AdaptiveAvgPool1d, nn.AdaptiveAvgPool2d, nn.AdaptiveAvgPool3d)):
-        info.update({
-            'output_size': layer.output_size
-        })
-    
-    elif isinstance(layer, (nn.RNN, nn.LSTM, nn.GRU)):
-        info.update({
-            'input_size': layer.input_size,
-            'hidden_size': layer.hidden_size,
-            'num_layers': layer.num_layers,
-            'bias': layer.bias,
-            'batch_first': layer.batch_first,
-            'dropout': layer.dropout,
-            'bidirectional': layer.bidirectional
-        })
-    
-    elif isinstance(layer, nn.Linear):
-        info.update({
-            'in_features': layer.in_features,
-            'out_features': layer.out_features,
-            'bias': layer.bias is not None
-        })
-    
-    elif isinstance(layer, (nn.Dropout, nn.Dropout2d, nn.Dropout3d)):
-        info.update({
-            'p': layer.p,
-            'inplace': layer.inplace if hasattr(layer, 'inplace') else False
-        })
-    
-    elif isinstance(layer, (nn.ReLU, nn.LeakyReLU, nn.PReLU, nn.RReLU,
-                          nn.SELU, nn.CELU, nn.GELU)):
-        info.update({
-            'inplace': layer.inplace if hasattr(layer, 'inplace') else False
-        })
-        if isinstance(layer, nn.LeakyReLU):
-            info['negative_slope'] = layer.negative_slope
-    
-    elif isinstance(layer, nn.Embedding):
-        info.update({
-            'num_embeddings': layer.num_embeddings,
-            'embedding_dim': layer.embedding_dim,
-            'padding_idx': layer.padding_idx,
-            'max_norm': layer.max_norm,
-            'norm_type': layer.norm_type,
-            'scale_grad_by_freq': layer.scale_grad_by_freq,
-            'sparse': layer.sparse
-        })
-    
-    elif isinstance(layer, (nn.TransformerEncoderLayer, nn.TransformerDecoderLayer)):
-        info.update({
-            'd_model': layer.d_model,
-            'nhead': layer.nhead,
-            'dim_feedforward': layer.dim_feedforward,
-            'dropout': layer.dropout,
-            'activation': layer.activation.__class__.__name__ if layer.activation else None,
-            'layer_norm_eps': layer.layer_norm_eps,
-            'batch_first': layer.batch_first,
-            'norm_first': layer.norm_first
-        })
+    layer_type = type(layer)
+    handler = _LAYER_EXTRACTORS.get(layer_type)
+    if handler is None:
+        # Subclass or unknown layer; remember the resolution for next time
+        handler = _LAYER_EXTRACTORS[layer_type] = _find_extractor(layer_type)
+    info.update(handler(layer))
     
     return info
 
 def analyze_model(model: nn.Module) -> Dict[str, Any]:
     """Analyze a PyTorch model and extract its structure."""
-    nodes: List[Dict[str, Any]] = []
-    connections: List[Dict[str, Any]] = []
-    node_count = 0
+    # Nodes and edges are collected as parallel lists (node ids are list
+    # indices) and only turned into dicts once, when the result is built
+    node_types: List[str] = []
+    node_names: List[str] = []
+    node_properties: List[Dict[str, Any]] = []
+    sources: List[int] = []
+    targets: List[int] = []
 
     def add_node(layer: nn.Module, name: str) -> int:
-        nonlocal node_count
-        node_id = node_count
-        node_count += 1
-        
-        layer_type = layer.__class__.__name__
-        layer_info = extract_layer_info(layer)
-        
-        nodes.append({
-            'id': str(node_id),
-            'type': layer_type,
-            'name': name,
-            'properties': layer_info
-        })
-        
-        return node_id
-
-    def process_container(container: nn.Module, prefix: str = '') -> List[int]:
-        container_nodes = []
-        
-        # Process named children
-        for name, child in container.named_children():
-            full_name = f'{prefix}.{name}' if prefix else name
-            
-            if isinstance(child, (nn.Sequential, nn.ModuleList, nn.ModuleDict)):
-                child_nodes = process_container(child, full_name)
-                container_nodes.extend(child_nodes)
-            else:
-                node_id = add_node(child, full_name)
-                container_nodes.append(node_id)
-                
-                # If it's a container, process its children
-                if len(list(child.children())) > 0:
-                    child_nodes = process_container(child, full_name)
-                    # Connect this container to its first child
-                    if child_nodes:
-                        connections.append({
-                            'source': str(node_id),
-                            'target': str(child_nodes[0]),
-                            'weight': 1.0
-                        })
-                        # Connect children in sequence
-                        for i in range(len(child_nodes) - 1):
-                            connections.append({
-                                'source': str(child_nodes[i]),
-                                'target': str(child_nodes[i + 1]),
-                                'weight': 1.0
-                            })
-        
-        # Connect nodes in sequence if in a Sequential container
-        if isinstance(container, nn.Sequential):
-            for i in range(len(container_nodes) - 1):
-                connections.append({
-                    'source': str(container_nodes[i]),
-                    'target': str(container_nodes[i + 1]),
-                    'weight': 1.0
-                })
-        
-        return container_nodes
-
-    # Start processing from the root
-    process_container(model)
+        node_types.append(layer.__class__.__name__)
+        node_names.append(name)
+        node_properties.append(extract_layer_info(layer))
+        return len(node_types) - 1
+
+    # Each group is (head node id or None, member node ids, chain members in order).
+    # A head is connected to its first member; chained members are linked in sequence.
+    groups: List[Tuple[Optional[int], List[int], bool]] = []
+
+    def new_group(head: Optional[int], chain: bool) -> List[int]:
+        members: List[int] = []
+        groups.append((head, members, chain))
+        return members
 
+    # Explicit pre-order traversal; every module is visited exactly once. Each
+    # stack entry carries the member lists its node should be appended to:
+    # containers splice their children into the enclosing level, while any
+    # other module becomes the head of a new group for its own children.
+    stack: List[Tuple[nn.Module, str, Tuple[List[int], ...]]] = []
+
+    def push_children(module: nn.Module, prefix: str, owners: Tuple[List[int], ...]) -> None:
+        children = list(module.named_children())
+        for name, child in reversed(children):
+            stack.append((child, f'{prefix}.{name}' if prefix else name, owners))
+
+    push_children(model, '', (new_group(None, isinstance(model, nn.Sequential)),))
+    while stack:
+        module, name, owners = stack.pop()
+        if isinstance(module, (nn.Sequential, nn.ModuleList, nn.ModuleDict)):
+            if isinstance(module, nn.Sequential):
+                owners = owners + (new_group(None, True),)
+            push_children(module, name, owners)
+        else:
+            node_id = add_node(module, name)
+            for members in owners:
+                members.append(node_id)
+            push_children(module, name, (new_group(node_id, True),))
+
+    for head, members, chain in groups:
+        if head is not None and members:
+            sources.append(head)
+            targets.append(members[0])
+        if chain:
+            sources.extend(members[:-1])
+            targets.extend(members[1:])
+
+    ids = [str(node_id) for node_id in range(len(node_types))]
     return {
         'type': 'PyTorch',
-        'nodes': nodes,
-        'connections': connections
+        'nodes': [
+            {'id': node_id, 'type': layer_type, 'name': name, 'properties': properties}
+            for node_id, layer_type, name, properties in zip(ids, node_types, node_names, node_properties)
+        ],
+        'connections': [
+            {'source': ids[source], 'target': ids[target], 'weight': 1.0}
+            for source, target in zip(sources, targets)
+        ]
     }
 
+def load_and_analyze(weights_path: str) -> Dict[str, Any]:
+    """Load an uploaded model from disk and analyze it; runs in a loader worker."""
+    # The upload is a whole pickled nn.Module, so it cannot go through the
+    # weights_only unpickler
+    model = load_checkpoint(weights_path, weights_only=False)
+    network = analyze_model(model)
+    
+    # Free the module (and any reference cycles it is part of) before the
+    # result is sent back, rather than whenever the collector next runs
+    del model
+    gc.collect()
+    return network
+
 @app.post("/api/import/pytorch")
 async def import_pytorch_model(
     weights_file: UploadFile = File(...),
     info_file: UploadFile = File(...)
-) -> Dict[str, Any]:
+) -> Response:
     try:
         # Create temporary directory
         with tempfile.TemporaryDirectory() as temp_dir:
-            # Save uploaded files
+            # Stream the weights to disk so memory stays bounded regardless of
+            # model size, hashing them on the way for the response cache
             weights_path = os.path.join(temp_dir, weights_file.filename)
-            info_path = os.path.join(temp_dir, info_file.filename)
-            
-            with open(weights_path, 'wb') as f:
-                f.write(await weights_file.read())
-            with open(info_path, 'wb') as f:
-                f.write(await info_file.read())
+            weights_hash = hashlib.sha256()
+            await save_upload(weights_file, weights_path, weights_hash)
             
-            # Load model info
-            with open(info_path, 'r') as f:
-                model_info = json.load(f)
+            # Model info is plain JSON and small, so it is parsed in memory
+            info_bytes = await info_file.read()
+            model_info = json.loads(info_bytes)
             
-            # Load model weights
-            model = torch.load(weights_path, map_location='cpu')
+            cache_key = f"{weights_hash.hexdigest()}:{hashlib.sha256(info_bytes).hexdigest()}"
+            cached = cached_response(cache_key)
+            if cached is not None:
+                return cached
             
-            # Analyze model structure
-            network = analyze_model(model)
+            # Load and analyze the model structure in a loader worker
+            network = await run_in_loader(app, load_and_analyze, weights_path)
             
-            return network
+            # Already plain Python types; hand straight to orjson
+            response = ORJSONResponse(network)
+            remember_response(cache_key, response)
+            return response
             
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
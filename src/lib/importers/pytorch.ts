@@ -86,7 +86,7 @@ export class PyTorchImporter extends BaseImporter {
   /**
    * Import a PyTorch model file
    * @param weightsFile The .pt or .pth weights file
-   * @param infoFile The .info file
+   * @param infoFile The .json (or legacy .pt/.pth) model structure file
    * @returns The converted network in Neuroscope format
    */
   public async importModel(weightsFile: File, infoFile: File): Promise<NeuroscopeNetwork> {
@@ -94,8 +94,8 @@ export class PyTorchImporter extends BaseImporter {
     if (!weightsFile.name.endsWith('.pt') && !weightsFile.name.endsWith('.pth')) {
       throw new Error('Invalid weights file type. Only .pt and .pth files are supported.');
     }
-    if (!infoFile.name.endsWith('.pt')) {
-      throw new Error('Invalid info file type. Only .pt files are supported.');
+    if (!['.json', '.pt', '.pth'].some((ext) => infoFile.name.endsWith(ext))) {
+      throw new Error('Invalid info file type. Only .json, .pt and .pth files are supported.');
     }
 
     try {
@@ -1,15 +1,60 @@
-import io
+import gc
+import hashlib
+import logging
 import os
 import tempfile
-from typing import Dict, List
+from typing import Any, Dict, Union
 
+import orjson
 import torch
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import FastAPI, File, HTTPException, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from model_uploads import (
+    cached_response,
+    lifespan,
+    load_checkpoint,
+    remember_response,
+    run_in_loader,
+    save_upload,
+)
 from models import NeuroscopeNetwork
 from pytorch_converter import convert_pytorch_model
 
-app = FastAPI(title="Neuroscope Python Bridge")
+def load_and_convert(weights_path: str, model_info: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Load an uploaded model from disk and convert it; runs in a loader worker.
+
+    `model_info` is either the already parsed structure info or the path of a
+    legacy .pt info file.
+    """
+    # Both files only hold tensors and plain containers, so the safe
+    # weights_only unpickler is enough
+    weights = load_checkpoint(weights_path, weights_only=True)
+    if isinstance(model_info, str):
+        model_info = torch.load(model_info, map_location=torch.device('cpu'), weights_only=True)
+    
+    # Validate model info structure
+    if not isinstance(model_info, dict) or 'layers' not in model_info:
+        raise ValueError("Invalid model info format. Expected a dictionary with 'layers' key")
+        
+    network = convert_pytorch_model({
+        'state_dict': weights,
+        'model_structure': model_info
+    })
+    
+    # Free the loaded tensors before the result is sent back, rather than
+    # whenever the collector next runs
+    del weights
+    gc.collect()
+    return network.model_dump()
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="Neuroscope Python Bridge",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
 # Configure CORS for local development
 app.add_middleware(
@@ -35,69 +80,69 @@ async def health_check() -> Dict[str, str]:
 async def import_pytorch_model(
     weights_file: UploadFile = File(...),
     info_file: UploadFile = File(...)
-) -> NeuroscopeNetwork:
+) -> Response:
     """Import a PyTorch model file and convert it to a NeuroscopeNetwork.
     
     Args:
         weights_file: The PyTorch weights file (.pt or .pth)
-        info_file: The model structure info file (.pt or .pth)
+        info_file: The model structure info file (.json, or legacy .pt/.pth)
         
     Returns:
-        NeuroscopeNetwork: The converted network
+        Response: The converted NeuroscopeNetwork as JSON
         
     Raises:
         HTTPException: If the file type is invalid or model loading fails
     """
-    for file in [weights_file, info_file]:
-        if not file.filename.endswith(('.pt', '.pth')):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid file type for {file.filename}. Only .pt and .pth files are supported."
-            )
+    if not weights_file.filename.endswith(('.pt', '.pth')):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type for {weights_file.filename}. Only .pt and .pth files are supported."
+        )
+    if not info_file.filename.endswith(('.json', '.pt', '.pth')):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type for {info_file.filename}. Only .json, .pt and .pth files are supported."
+        )
     
     try:
-        # Create temporary files
-        temp_files: List[str] = []
-        
-        # Load weights
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            content = await weights_file.read()
-            tmp_file.write(content)
-            tmp_file.flush()
-            temp_files.append(tmp_file.name)
-            weights = torch.load(tmp_file.name, map_location=torch.device('cpu'))
-        
-        # Load structure info
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            content = await info_file.read()
-            tmp_file.write(content)
-            tmp_file.flush()
-            temp_files.append(tmp_file.name)
-            model_info = torch.load(tmp_file.name, map_location=torch.device('cpu'))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            weights_path = os.path.join(temp_dir, 'weights.pt')
+            
+            # Stream the weights to disk so memory stays bounded regardless of
+            # model size, hashing them on the way for the response cache
+            weights_hash = hashlib.sha256()
+            info_hash = hashlib.sha256()
+            await save_upload(weights_file, weights_path, weights_hash)
             
-        # Clean up temp files
-        for file in temp_files:
-            os.unlink(file)
+            # JSON model info is small and parsed in memory; .pt info files
+            # still work but go through the much slower torch unpickler
+            model_info: Union[str, Dict[str, Any]]
+            if info_file.filename.endswith('.json'):
+                info_bytes = await info_file.read()
+                info_hash.update(info_bytes)
+                model_info = orjson.loads(info_bytes)
+            else:
+                logger.warning(
+                    "Model info file %s is a torch pickle; save it as .json instead",
+                    info_file.filename
+                )
+                model_info = os.path.join(temp_dir, 'info.pt')
+                await save_upload(info_file, model_info, info_hash)
             
-        # Validate model info structure
-        if not isinstance(model_info, dict) or 'layers' not in model_info:
-            raise ValueError("Invalid model info format. Expected a dictionary with 'layers' key")
+            cache_key = f"{weights_hash.hexdigest()}:{info_hash.hexdigest()}"
+            cached = cached_response(cache_key)
+            if cached is not None:
+                return cached
             
-        # Convert model to network
-        network = convert_pytorch_model({
-            'state_dict': weights,
-            'model_structure': model_info
-        })
-        return network
+            # Convert in a loader worker while the uploaded files still exist
+            network = await run_in_loader(app, load_and_convert, weights_path, model_info)
+            # Encode with orjson directly instead of FastAPI's jsonable_encoder + stdlib json
+            response = ORJSONResponse(network)
+            remember_response(cache_key, response)
+            return response
             
     except Exception as e:
-        # Clean up temp files in case of error
-        for file in temp_files:
-            try:
-                os.unlink(file)
-            except:
-                pass
         raise HTTPException(
             status_code=500,
             detail=f"Failed to load model: {str(e)}"
-        ) 
\ No newline at end of file
+        )
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""Upload handling and the model loader pool for the Python service.
+
+src/lib/bridge/model_uploads.py holds the same helpers for the bridge
+service, which runs as a separate app; keep the two in sync.
+"""
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Any, Callable, List, Optional, Tuple
+
+import torch
+from fastapi import FastAPI, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Encoded responses of recently imported checkpoints, keyed by upload content hash
+RESPONSE_CACHE_SIZE = 32
+_response_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+# Worker processes that load and convert uploaded models
+LOADER_WORKERS = min(4, os.cpu_count() or 1)
+
+def warm_torch() -> None:
+    """Prime a loader worker's torch imports and allocator with a dummy load."""
+    buffer = io.BytesIO()
+    torch.save(torch.zeros(1), buffer)
+    buffer.seek(0)
+    torch.load(buffer, weights_only=True)
+
+def load_checkpoint(path: str, weights_only: bool) -> Any:
+    """torch.load a file onto the CPU, memory-mapped so tensors are only paged in when touched.
+
+    mmap (torch >= 2.1) only works for zip-format files; legacy checkpoints
+    saved with _use_new_zipfile_serialization=False are read normally.
+    """
+    try:
+        return torch.load(path, map_location='cpu', mmap=True, weights_only=weights_only)
+    except RuntimeError as e:
+        if '_use_new_zipfile_serialization' not in str(e):
+            raise
+        return torch.load(path, map_location='cpu', weights_only=weights_only)
+
+def start_loader() -> Tuple[ProcessPoolExecutor, List[Future]]:
+    """Start a loader pool and have every worker run `warm_torch` right away.
+
+    Workers are otherwise only spawned on demand, leaving the first requests
+    to pay for the process start and torch import. They are started from a
+    fork server (spawn where there is none) rather than forked from the
+    multithreaded server process.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    executor = ProcessPoolExecutor(
+        max_workers=LOADER_WORKERS, mp_context=context, initializer=warm_torch
+    )
+    warmups = [executor.submit(os.getpid) for _ in range(LOADER_WORKERS)]
+    return executor, warmups
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # torch.load holds the GIL while unpickling, so loading happens in
+    # separate, pre-warmed processes to keep the event loop responsive
+    executor, warmups = start_loader()
+    app.state.loader = executor
+    try:
+        await asyncio.gather(*(asyncio.wrap_future(warmup) for warmup in warmups))
+        yield
+    finally:
+        app.state.loader.shutdown()
+
+async def run_in_loader(app: FastAPI, fn: Callable[..., Any], *args: Any) -> Any:
+    """Run `fn(*args)` in the loader pool.
+
+    If a worker died (say, killed for running out of memory on a huge
+    checkpoint) the pool is unusable; it is replaced so later requests work
+    again, and the error is re-raised for this one.
+    """
+    executor = app.state.loader
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    except BrokenProcessPool:
+        if app.state.loader is executor:
+            app.state.loader, _ = start_loader()
+            executor.shutdown(wait=False)
+        raise
+
+async def save_upload(upload: UploadFile, path: str, hasher: Optional["hashlib._Hash"] = None) -> None:
+    """Stream an uploaded file to `path` in fixed-size chunks, optionally hashing it on the way."""
+    with open(path, 'wb') as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            if hasher is not None:
+                hasher.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+
+def cached_response(key: str) -> Optional[Response]:
+    """Return the cached JSON response for an upload hash, if there is one."""
+    body = _response_cache.get(key)
+    if body is None:
+        return None
+    _response_cache.move_to_end(key)
+    return Response(content=body, media_type="application/json")
+
+def remember_response(key: str, response: Response) -> None:
+    """Cache an encoded response, evicting the least recently used entry when full."""
+    _response_cache[key] = bytes(response.body)
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
\ No newline at end of file
@@ -1,12 +1,12 @@
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Literal, Mapping, Tuple, TypedDict, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 
 
 class NetworkNode(BaseModel):
     id: str
     type: str
-    properties: Dict[str, Any]
+    properties: Mapping[str, Any]
 
 class NetworkConnection(BaseModel):
     source: str
@@ -15,47 +15,48 @@ class NetworkConnection(BaseModel):
     properties: Dict[str, Any]
 
 class NeuroscopeNetwork(BaseModel):
-    type: str = Field(..., pattern="^(ANN|SNN|Connectome)$")
+    type: Literal["ANN", "SNN", "Connectome"]
     nodes: List[NetworkNode]
     connections: List[NetworkConnection]
 
-class LayerProperties(BaseModel):
+class LayerProperties(TypedDict, total=False):
+    """Per-layer properties, kept as a plain dict; only present fields are set."""
     type: str
     trainable_parameters: int
     
     # Common optional properties
-    has_bias: Optional[bool] = None
+    has_bias: bool
     
     # Linear layer properties
-    in_features: Optional[int] = None
-    out_features: Optional[int] = None
+    in_features: int
+    out_features: int
     
     # Convolutional layer properties (1D and 2D)
-    in_channels: Optional[int] = None
-    out_channels: Optional[int] = None
-    kernel_size: Optional[Union[int, Tuple[int, int]]] = None
-    stride: Optional[Union[int, Tuple[int, int]]] = None
-    padding: Optional[Union[int, Tuple[int, int]]] = None
+    in_channels: int
+    out_channels: int
+    kernel_size: Union[int, Tuple[int, int]]
+    stride: Union[int, Tuple[int, int]]
+    padding: Union[int, Tuple[int, int]]
     
     # BatchNorm properties
-    num_features: Optional[int] = None
-    eps: Optional[float] = None
-    momentum: Optional[float] = None
-    affine: Optional[bool] = None
+    num_features: int
+    eps: float
+    momentum: float
+    affine: bool
     
     # Recurrent layer properties
-    input_size: Optional[int] = None
-    hidden_size: Optional[int] = None
-    num_layers: Optional[int] = None
-    bidirectional: Optional[bool] = None
+    input_size: int
+    hidden_size: int
+    num_layers: int
+    bidirectional: bool
     
     # Activation function properties
-    activation_type: Optional[str] = None
-    inplace: Optional[bool] = None
-    negative_slope: Optional[float] = None
+    activation_type: str
+    inplace: bool
+    negative_slope: float
     
     # Pooling layer properties
-    output_size: Optional[Union[int, Tuple[int, int]]] = None
+    output_size: Union[int, Tuple[int, int]]
     
     # Dropout properties
-    p: Optional[float] = None 
\ No newline at end of file
+    p: float 
\ No newline at end of file
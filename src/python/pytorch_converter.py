@@ -1,115 +1,128 @@
-from typing import Any, Dict, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from math import prod
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, cast
 
-import numpy as np
 import torch
-import torch.nn as nn
-from models import (LayerProperties, NetworkConnection, NetworkNode,
-                    NeuroscopeNetwork)
+from models import LayerProperties, NetworkConnection, NetworkNode, NeuroscopeNetwork
 
 
-def create_layer_from_info(layer_info: Dict[str, Any]) -> nn.Module:
-    """Create a PyTorch layer from layer info dictionary."""
+# Below this many elements torch runs a reduction on the calling thread
+# (at::internal::GRAIN_SIZE); larger ones already use all intra-op threads
+_PARALLEL_GRAIN = 32768
+
+def _wstats(w: torch.Tensor) -> torch.Tensor:
+    """Max, min and population std of a weight tensor, as a float64 tensor of shape (3,).
+
+    The result stays a tensor so callers can stack many of them and convert
+    to Python floats in one go.
+    """
+    return torch.stack([torch.max(w), torch.min(w), torch.std(w, unbiased=False)]).double()
+
+def _kernel_numel(kernel_size: Union[int, Tuple[int, ...]], dims: int) -> int:
+    """Number of elements in a convolution kernel."""
+    if isinstance(kernel_size, int):
+        return kernel_size ** dims
+    return prod(kernel_size)
+
+def _conv_parameters(layer_info: Dict[str, Any], has_bias: bool, dims: int) -> int:
+    out_channels = layer_info['out_channels']
+    weight = (layer_info['in_channels'] // layer_info.get('groups', 1)) * out_channels \
+        * _kernel_numel(layer_info.get('kernel_size', 3), dims)
+    return weight + (out_channels if has_bias else 0)
+
+def _rnn_parameters(layer_info: Dict[str, Any], has_bias: bool, gates: int) -> int:
+    hidden_size = layer_info['hidden_size']
+    directions = 2 if layer_info.get('bidirectional', False) else 1
+    total = 0
+    for layer in range(layer_info.get('num_layers', 1)):
+        input_size = layer_info['input_size'] if layer == 0 else hidden_size * directions
+        per_direction = gates * hidden_size * (input_size + hidden_size)
+        if has_bias:
+            per_direction += 2 * gates * hidden_size
+        total += directions * per_direction
+    return total
+
+def _batchnorm_parameters(layer_info: Dict[str, Any], has_bias: bool) -> int:
+    return 2 * layer_info['num_features'] if layer_info.get('affine', True) else 0
+
+# Trainable parameter count of each layer type, computed from its metadata
+_PARAM_COUNT: Dict[str, Callable[[Dict[str, Any], bool], int]] = {
+    'Linear': lambda info, has_bias: info['in_features'] * info['out_features'] + (info['out_features'] if has_bias else 0),
+    'Conv1d': lambda info, has_bias: _conv_parameters(info, has_bias, 1),
+    'Conv2d': lambda info, has_bias: _conv_parameters(info, has_bias, 2),
+    'BatchNorm1d': _batchnorm_parameters,
+    'BatchNorm2d': _batchnorm_parameters,
+    'LSTM': lambda info, has_bias: _rnn_parameters(info, has_bias, 4),
+    'GRU': lambda info, has_bias: _rnn_parameters(info, has_bias, 3),
+}
+
+# torch.nn constructor defaults, used when the structure info leaves them out
+BATCHNORM_EPS = 1e-5
+BATCHNORM_MOMENTUM = 0.1
+DROPOUT_P = 0.5
+LEAKY_RELU_SLOPE = 0.01
+
+# Supported layer types without trainable parameters
+_PARAMETER_FREE_TYPES = {'ReLU', 'LeakyReLU', 'Sigmoid', 'Tanh', 'MaxPool1d', 'MaxPool2d', 'Dropout'}
+
+def get_layer_properties(layer_info: Dict[str, Any], has_bias: bool) -> LayerProperties:
+    """Extract layer properties from its structure info.
+
+    Everything is derived from metadata; no PyTorch layer is instantiated.
+    The inputs are trusted, so nothing is validated; fields that come out
+    as None are left out of the result.
+    """
     layer_type = layer_info['type']
-    if layer_type == 'Conv2d':
-        return nn.Conv2d(
-            in_channels=layer_info['in_channels'],
-            out_channels=layer_info['out_channels'],
-            kernel_size=3,  # Default values since we don't need the exact params
-            padding=1
-        )
-    elif layer_type == 'Conv1d':
-        return nn.Conv1d(
-            in_channels=layer_info['in_channels'],
-            out_channels=layer_info['out_channels'],
-            kernel_size=layer_info.get('kernel_size', 3)
-        )
-    elif layer_type == 'Linear':
-        return nn.Linear(
-            in_features=layer_info['in_features'],
-            out_features=layer_info['out_features']
-        )
-    elif layer_type == 'BatchNorm2d':
-        return nn.BatchNorm2d(layer_info['num_features'])
-    elif layer_type == 'BatchNorm1d':
-        return nn.BatchNorm1d(layer_info['num_features'])
-    elif layer_type == 'ReLU':
-        return nn.ReLU()
-    elif layer_type == 'MaxPool2d':
-        return nn.MaxPool2d(kernel_size=2)
-    elif layer_type == 'MaxPool1d':
-        return nn.MaxPool1d(kernel_size=layer_info.get('kernel_size', 2))
-    elif layer_type == 'Dropout':
-        return nn.Dropout(p=layer_info.get('p', 0.5))
-    elif layer_type == 'LSTM':
-        return nn.LSTM(
-            input_size=layer_info['input_size'],
-            hidden_size=layer_info['hidden_size'],
-            num_layers=layer_info.get('num_layers', 1),
-            bidirectional=layer_info.get('bidirectional', False)
-        )
-    elif layer_type == 'GRU':
-        return nn.GRU(
-            input_size=layer_info['input_size'],
-            hidden_size=layer_info['hidden_size'],
-            num_layers=layer_info.get('num_layers', 1),
-            bidirectional=layer_info.get('bidirectional', False)
-        )
-    elif layer_type == 'LeakyReLU':
-        return nn.LeakyReLU(negative_slope=layer_info.get('negative_slope', 0.01))
-    elif layer_type == 'Sigmoid':
-        return nn.Sigmoid()
-    elif layer_type == 'Tanh':
-        return nn.Tanh()
-    else:
+    if layer_type not in _PARAM_COUNT and layer_type not in _PARAMETER_FREE_TYPES:
         raise ValueError(f"Unsupported layer type: {layer_type}")
-
-def get_layer_properties(layer: nn.Module, layer_info: Dict[str, Any]) -> LayerProperties:
-    """Extract properties from a PyTorch layer."""
-    props = {
-        "type": layer_info['type'],
-        "trainable_parameters": sum(p.numel() for p in layer.parameters() if p.requires_grad),
+    
+    count = _PARAM_COUNT.get(layer_type)
+    
+    props: Dict[str, Any] = {
+        "type": layer_type,
+        "trainable_parameters": count(layer_info, has_bias) if count else 0,
     }
     
     # Linear layer properties
-    if isinstance(layer, nn.Linear):
+    if layer_type == 'Linear':
         props.update({
             "in_features": layer_info['in_features'],
             "out_features": layer_info['out_features'],
-            "has_bias": layer.bias is not None
+            "has_bias": has_bias
         })
     
     # Convolutional layer properties (1D and 2D)
-    elif isinstance(layer, (nn.Conv1d, nn.Conv2d)):
+    elif layer_type in ('Conv1d', 'Conv2d'):
         props.update({
             "in_channels": layer_info['in_channels'],
             "out_channels": layer_info['out_channels'],
             "kernel_size": layer_info.get('kernel_size', 3),
             "stride": layer_info.get('stride', 1),
             "padding": layer_info.get('padding', 0),
-            "has_bias": layer.bias is not None
+            "has_bias": has_bias
         })
     
     # BatchNorm properties (1D and 2D)
-    elif isinstance(layer, (nn.BatchNorm1d, nn.BatchNorm2d)):
+    elif layer_type in ('BatchNorm1d', 'BatchNorm2d'):
         props.update({
             "num_features": layer_info['num_features'],
-            "eps": layer.eps,
-            "momentum": layer.momentum,
-            "affine": layer.affine
+            "eps": layer_info.get('eps', BATCHNORM_EPS),
+            "momentum": layer_info.get('momentum', BATCHNORM_MOMENTUM),
+            "affine": layer_info.get('affine', True)
         })
     
     # Recurrent layer properties
-    elif isinstance(layer, (nn.LSTM, nn.GRU)):
+    elif layer_type in ('LSTM', 'GRU'):
         props.update({
             "input_size": layer_info['input_size'],
             "hidden_size": layer_info['hidden_size'],
             "num_layers": layer_info.get('num_layers', 1),
             "bidirectional": layer_info.get('bidirectional', False),
-            "has_bias": layer.bias_hh_l0 is not None
+            "has_bias": has_bias
         })
     
     # Pooling layer properties (1D and 2D)
-    elif isinstance(layer, (nn.MaxPool1d, nn.MaxPool2d, nn.AvgPool1d, nn.AvgPool2d)):
+    elif layer_type in ('MaxPool1d', 'MaxPool2d'):
         props.update({
             "kernel_size": layer_info.get('kernel_size', 2),
             "stride": layer_info.get('stride', None),
@@ -117,29 +130,29 @@ def get_layer_properties(layer: nn.Module, layer_info: Dict[str, Any]) -> LayerP
         })
     
     # Dropout properties
-    elif isinstance(layer, nn.Dropout):
+    elif layer_type == 'Dropout':
         props.update({
-            "p": layer_info.get('p', 0.5)
+            "p": layer_info.get('p', DROPOUT_P)
         })
     
     # Activation function properties
-    elif isinstance(layer, nn.ReLU):
+    elif layer_type == 'ReLU':
         props.update({
             "activation_type": "ReLU",
-            "inplace": getattr(layer, 'inplace', False)
+            "inplace": layer_info.get('inplace', False)
         })
-    elif isinstance(layer, nn.LeakyReLU):
+    elif layer_type == 'LeakyReLU':
         props.update({
             "activation_type": "LeakyReLU",
-            "negative_slope": layer_info.get('negative_slope', 0.01),
-            "inplace": getattr(layer, 'inplace', False)
+            "negative_slope": layer_info.get('negative_slope', LEAKY_RELU_SLOPE),
+            "inplace": layer_info.get('inplace', False)
         })
-    elif isinstance(layer, (nn.Sigmoid, nn.Tanh)):
+    elif layer_type in ('Sigmoid', 'Tanh'):
         props.update({
-            "activation_type": layer.__class__.__name__
+            "activation_type": layer_type
         })
     
-    return LayerProperties(**props)
+    return cast(LayerProperties, {key: value for key, value in props.items() if value is not None})
 
 def convert_pytorch_model(model_data: Dict[str, Any]) -> NeuroscopeNetwork:
     """Convert a PyTorch model state dict to a NeuroscopeNetwork."""
@@ -150,47 +163,72 @@ def convert_pytorch_model(model_data: Dict[str, Any]) -> NeuroscopeNetwork:
     structure = model_data['model_structure']
     state_dict = model_data['state_dict']
     
+    # Index the state dict by layer name once, instead of formatting and
+    # probing a key per layer. Recurrent layers store their bias as bias_hh_l0.
+    layer_weights = {
+        key[:-len('.weight')]: tensor
+        for key, tensor in state_dict.items() if key.endswith('.weight')
+    }
+    biased_layers = {
+        key.rsplit('.', 1)[0]
+        for key in state_dict if key.endswith(('.bias', '.bias_hh_l0'))
+    }
+    
     # Process each layer
+    edges: List[Tuple[str, str, Optional[torch.Tensor]]] = []
     prev_layer_id = None
     for i, layer_info in enumerate(structure['layers']):
         layer_id = f"layer_{i}"
         
-        # Create temporary layer to get properties
-        layer = create_layer_from_info(layer_info)
-        
         # Get layer properties
-        properties = get_layer_properties(layer, layer_info)
+        properties = get_layer_properties(layer_info, layer_info['name'] in biased_layers)
         
         # Create node
         nodes.append(NetworkNode(
             id=layer_id,
             type=layer_info['type'],
-            properties=properties.dict(exclude_none=True)
+            properties=properties
         ))
         
-        # Create connection from previous layer if it exists
+        # Connect from the previous layer; weight stats are filled in below
         if prev_layer_id is not None:
-            # Try to get weight statistics if available
-            weight_props = {}
-            weight_key = f"{layer_info['name']}.weight"
-            if weight_key in state_dict:
-                weight_data = state_dict[weight_key].cpu().numpy()
-                weight_props.update({
-                    "max_weight": float(np.max(weight_data)),
-                    "min_weight": float(np.min(weight_data)),
-                    "std_weight": float(np.std(weight_data)),
-                    "shape": list(weight_data.shape)
-                })
-            
-            connections.append(NetworkConnection(
-                source=prev_layer_id,
-                target=layer_id,
-                weight=1.0,  # Default weight
-                properties=weight_props
-            ))
+            edges.append((prev_layer_id, layer_id, layer_weights.get(layer_info['name'])))
         
         prev_layer_id = layer_id
     
+    # Reduce every weight tensor directly (no NumPy copy) and bring all the
+    # stats back to Python with a single tolist() rather than an .item() per
+    # value. Large tensors are reduced here with torch's own intra-op
+    # threads; small ones, which torch reduces single-threaded, are spread
+    # over a thread pool instead (the reductions release the GIL).
+    weights = [weight for _, _, weight in edges if weight is not None]
+    small = [i for i, weight in enumerate(weights) if weight.numel() < _PARALLEL_GRAIN]
+    results: Dict[int, torch.Tensor] = {}
+    threads = min(torch.get_num_threads(), len(small))
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results.update(zip(small, executor.map(_wstats, [weights[i] for i in small])))
+    stats = [results[i] if i in results else _wstats(weight) for i, weight in enumerate(weights)]
+    stat_values = iter(torch.stack(stats).tolist() if stats else [])
+    
+    for source, target, weight in edges:
+        weight_props = {}
+        if weight is not None:
+            max_weight, min_weight, std_weight = next(stat_values)
+            weight_props.update({
+                "max_weight": max_weight,
+                "min_weight": min_weight,
+                "std_weight": std_weight,
+                "shape": list(weight.shape)
+            })
+        
+        connections.append(NetworkConnection(
+            source=source,
+            target=target,
+            weight=1.0,  # Default weight
+            properties=weight_props
+        ))
+    
     return NeuroscopeNetwork(
         type="ANN",
         nodes=nodes,
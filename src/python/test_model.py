@@ -1,3 +1,5 @@
+import json
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -55,13 +57,28 @@ if __name__ == "__main__":
     
     # Save weights and structure separately
     weights_file = "test_model_weights.pt"
-    info_file = "test_model_info.pt"
+    info_file = "test_model_info.json"
     
     # Save weights
     torch.save(model.state_dict(), weights_file)
     
-    # Save structure info
-    torch.save(model_info, info_file)
+    # Save structure info as plain JSON so it loads without the torch unpickler
+    with open(info_file, 'w') as f:
+        json.dump(model_info, f)
+    
+    # Save a TorchScript version, compiled and frozen once here rather than at
+    # load time. optimize_for_inference is left to consumers (call it after
+    # torch.jit.load): its MKLDNN-folded graphs do not survive serialization.
+    scripted_file = "test_model_scripted.pt"
+    frozen = torch.jit.freeze(torch.jit.script(model.eval()))
+    torch.jit.save(frozen, scripted_file)
+    
+    # Check the saved module loads back and matches the eager model
+    example = torch.randn(1, 3, 32, 32)
+    with torch.no_grad():
+        reloaded = torch.jit.load(scripted_file)
+        assert torch.allclose(reloaded(example), model(example), atol=1e-5)
     
     print(f"Model weights saved as '{weights_file}'")
-    print(f"Model structure saved as '{info_file}'") 
\ No newline at end of file
+    print(f"Model structure saved as '{info_file}'")
+    print(f"Scripted model saved as '{scripted_file}'") 
\ No newline at end of file